@@ -1,17 +1,19 @@
+import argparse
 import asyncio
 import logging
-import sys
-from typing import Any, get_args
+import os
+from pathlib import Path
+from typing import get_args
 
-from llama_index.utils.workflow import draw_all_possible_flows  # type: ignore
+from pydantic import TypeAdapter
 
-from src.models import EvaluationResponse, Result
+from src.models import EvaluationResponse, Question, Result
 from src.services import EvaluationService
-from src.settings import GEMINI_MODELS, Settings
-from src.tools import get_tools
-from src.workflow import QuestionStartEvent, QuestionWorkflow
+from src.settings import GEMINI_MODELS, get_settings
+from src.tools import get_genai_client, get_tools
+from src.workflow import QuestionWorkflow
 
-settings = Settings()  # type: ignore
+settings = get_settings()
 evaluation_service = EvaluationService(settings.evaluation_api_base_url)
 
 logging.basicConfig(level=logging.INFO)
@@ -19,38 +21,101 @@ log = logging.getLogger(__name__)
 
 ALLOWED_COMMANDS = ["generate_answers", "submit_answers", "draw_workflow"]
 
-questions = evaluation_service.get_questions()
+# Resolved once; typing.get_args is not free
+GEMINI_MODEL_CHOICES: tuple[str, ...] = get_args(GEMINI_MODELS)
+
+parser = argparse.ArgumentParser(prog="python -m src.main")
+parser.add_argument("command", choices=ALLOWED_COMMANDS)
+parser.add_argument("--model", choices=GEMINI_MODEL_CHOICES)
+
+# Instantiated once so every result file shares the same validator
+RESULT_ADAPTER = TypeAdapter(Result)
+
+
+def get_result_files() -> list[Path]:
+    """
+    Get the result files with a single directory scan instead of one stat per entry.
+    """
+    if not settings.result_path.is_dir():
+        return []
+
+    with os.scandir(settings.result_path) as entries:
+        return [Path(entry.path) for entry in entries if entry.name.endswith(".json")]
 
 
 async def generate_answers() -> None:
+    settings.result_path.mkdir(parents=True, exist_ok=True)
+    questions = await evaluation_service.get_questions()
+
+    # Scan the result directory once up front instead of stat-ing per question
+    done_task_ids = {file_.stem for file_ in get_result_files()}
+    pending_questions = [
+        question for question in questions if question.task_id not in done_task_ids
+    ]
+    if len(pending_questions) < len(questions):
+        log.info(
+            f"Skipping {len(questions) - len(pending_questions)} questions with existing result files."
+        )
+
+    # Prefetch the attachments of all outstanding questions in the background,
+    # so downloads overlap with the LLM calls of earlier questions
+    data_path = Path("data")
+    data_path.mkdir(parents=True, exist_ok=True)
+    download_semaphore = asyncio.Semaphore(settings.max_concurrency)
+
+    async def prefetch_file(question: Question) -> Path:
+        file_path = data_path / question.file_name
+        async with download_semaphore:
+            if not (file_path.exists() and file_path.stat().st_size > 0):
+                await evaluation_service.get_file(question, file_path)
+        return file_path
+
+    prefetched_files = {
+        question.task_id: asyncio.create_task(prefetch_file(question))
+        for question in pending_questions
+        if question.file_name
+    }
+
     workflow = QuestionWorkflow(
         model=settings.gemini_model,
-        tools=get_tools(),
+        tools=list(get_tools()),
         gemini_api_key=settings.gemini_api_key,
+        gemini_client=get_genai_client(),
         evaluation_service=evaluation_service,
+        data_path=data_path,
+        prefetched_files=prefetched_files,
         timeout=120,
     )
 
-    for question in questions:
-        result_file_path = settings.result_path / f"{question.task_id}.json"
-        if result_file_path.exists():
-            log.info(
-                f"Result file already exists for task {question.task_id}. Skipping."
-            )
-            continue
+    # Upload the attachments in the background while the first workflows run
+    preupload_task = asyncio.create_task(workflow.preupload_files(pending_questions))
 
-        log.info(f"Processing Task: {question.task_id}")
-        result = await workflow.run(
-            start_event=QuestionStartEvent(
-                question=question,
-            )
+    async def persist_result(result: Result) -> None:
+        result_file_path = settings.result_path / f"{result.question.task_id}.json"
+        # Write in a worker thread so the loop keeps serving other questions
+        await asyncio.to_thread(
+            result_file_path.write_bytes, result.model_dump_json().encode("utf-8")
         )
 
-        result_file_path.write_text(result.model_dump_json(indent=4))
+    outcomes = await workflow.run_batch(
+        pending_questions,
+        max_concurrency=settings.max_concurrency,
+        on_result=persist_result,
+    )
+    for question, outcome in zip(pending_questions, outcomes):
+        if isinstance(outcome, BaseException):
+            log.error(f"Task {question.task_id} failed: {outcome}")
+
+    await preupload_task
+
+    # Drop prefetches whose workflow failed before consuming them
+    for prefetch_task in prefetched_files.values():
+        prefetch_task.cancel()
 
 
 async def submit_answers() -> None:
-    answer_files = list(settings.result_path.glob("*.json"))
+    questions = await evaluation_service.get_questions()
+    answer_files = get_result_files()
     # Check if all answer files are generated
     if len(answer_files) < len(questions):
         log.warning(
@@ -59,8 +124,12 @@ async def submit_answers() -> None:
         )
         return
 
-    results = [Result.model_validate_json(file_.read_text()) for file_ in answer_files]
-    response: EvaluationResponse = evaluation_service.submit(
+    # Read the result files concurrently in worker threads
+    payloads = await asyncio.gather(
+        *[asyncio.to_thread(file_.read_bytes) for file_ in answer_files]
+    )
+    results = [RESULT_ADAPTER.validate_json(payload) for payload in payloads]
+    response: EvaluationResponse = await evaluation_service.submit(
         username=settings.huggingface_username,
         agent_code=settings.huggingface_space,
         results=results,
@@ -76,33 +145,32 @@ async def submit_answers() -> None:
 
 
 async def draw_workflow() -> None:
+    # Imported lazily, the other commands don't need it
+    from llama_index.utils.workflow import draw_all_possible_flows  # type: ignore
+
     draw_all_possible_flows(QuestionWorkflow, "workflow.html")
 
 
-async def main(command: str, **kwargs: Any) -> None:
+async def main(command: str, model: GEMINI_MODELS | None = None) -> None:
     # Use the provided model if specified
-    if "--model" in kwargs:
-        model = kwargs["--model"]
-        if model not in get_args(GEMINI_MODELS):
-            print(
-                "Please provide a valid model from the following models: "
-                f"[{', '.join(get_args(GEMINI_MODELS))}], e.g. `python -m src.main {command}"
-                f" --model={get_args(GEMINI_MODELS)[0]}`"
-            )
-            sys.exit(1)
+    if model:
         settings.gemini_model = model
 
-    if command == "generate_answers":
-        await generate_answers()
-    elif command == "submit_answers":
-        await submit_answers()
-    elif command == "draw_workflow":
-        await draw_workflow()
-    else:
-        raise ValueError(
-            f"Command {command} is not implemented. Please use one of the following commands: [{', '.join(ALLOWED_COMMANDS)}]"
-        )
+    try:
+        if command == "generate_answers":
+            await generate_answers()
+        elif command == "submit_answers":
+            await submit_answers()
+        elif command == "draw_workflow":
+            await draw_workflow()
+        else:
+            raise ValueError(
+                f"Command {command} is not implemented. Please use one of the following commands: [{', '.join(ALLOWED_COMMANDS)}]"
+            )
+    finally:
+        await evaluation_service.aclose()
 
 
 if __name__ == "__main__":
-    asyncio.run(main(sys.argv[1], **dict(arg.split("=") for arg in sys.argv[2:])))
+    args = parser.parse_args()
+    asyncio.run(main(args.command, model=args.model))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
 
 class Question(BaseModel):
@@ -7,15 +7,33 @@ class Question(BaseModel):
     file_name: str
     level: str = Field(..., alias="Level")
 
-    model_config = ConfigDict(populate_by_name=True, extra="ignore")
+    model_config = ConfigDict(populate_by_name=True, extra="ignore", frozen=True)
+
+
+# Instantiated once so the whole question list is validated in a single
+# pydantic-core pass, JSON parse included
+QUESTION_LIST_ADAPTER = TypeAdapter(list[Question])
+
+
+class Answer(BaseModel):
+    task_id: str
+    submitted_answer: str
 
 
 class Result(BaseModel):
     question: Question
     answer: str
 
-    def get_answer(self) -> dict[str, str]:
-        return {"task_id": self.question.task_id, "submitted_answer": self.answer}
+    model_config = ConfigDict(frozen=True)
+
+    def get_answer(self) -> Answer:
+        return Answer(task_id=self.question.task_id, submitted_answer=self.answer)
+
+
+class SubmitPayload(BaseModel):
+    username: str
+    agent_code: str
+    answers: list[Answer]
 
 
 class EvaluationResponse(BaseModel):
@@ -1,58 +1,169 @@
+import asyncio
 import logging
+import os
 from pathlib import Path
+from types import TracebackType
+from typing import Self
 
+import anyio
 import httpx
+import orjson
 from pydantic import HttpUrl
 
-from src.models import EvaluationResponse, Question, Result
+from src.models import (
+    QUESTION_LIST_ADAPTER,
+    EvaluationResponse,
+    Question,
+    Result,
+    SubmitPayload,
+)
 
 log = logging.getLogger(__name__)
 
 
 class EvaluationService:
-    def __init__(self, base_url: HttpUrl):
+    def __init__(self, base_url: HttpUrl, cache_path: Path = Path("results")):
         self.base_url = base_url
+        # Single long-lived client so all requests share one connection pool
+        self._client = httpx.AsyncClient(
+            base_url=str(base_url),
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            timeout=30.0,
+        )
 
-    def get_questions(self) -> list[Question]:
+        # Question list cache: memoized in-process, persisted to disk with the ETag
+        cache_path.mkdir(parents=True, exist_ok=True)
+        self._questions: list[Question] | None = None
+        self._questions_cache_path = cache_path / "_questions.json"
+        self._questions_etag_path = cache_path / "_questions.etag"
+
+        # One lock per download target, so concurrent callers never write the
+        # same file at the same time
+        self._file_locks: dict[Path, asyncio.Lock] = {}
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Close the underlying HTTP client.
+        """
+        await self._client.aclose()
+
+    async def get_questions(self) -> list[Question]:
         """
         Get the questions from the evaluation service.
+
+        The response is memoized for the lifetime of the service and persisted
+        to disk together with its ETag, so subsequent invocations revalidate
+        with `If-None-Match` instead of re-downloading the full list.
         """
+        if self._questions is not None:
+            return self._questions
+
+        headers = {}
+        if self._questions_cache_path.exists() and self._questions_etag_path.exists():
+            headers["If-None-Match"] = self._questions_etag_path.read_text().strip()
+
         log.info("Fetching questions from the evaluation service")
-        url = str(self.base_url) + "questions"
-        response = httpx.get(url)
-        response.raise_for_status()
+        response = await self._client.get("questions", headers=headers)
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            log.info("Question list unchanged, using the cached copy")
+            body = self._questions_cache_path.read_bytes()
+        else:
+            response.raise_for_status()
+            body = response.content
+            self._questions_cache_path.write_bytes(body)
+            if etag := response.headers.get("etag"):
+                self._questions_etag_path.write_text(etag)
 
-        return [Question.model_validate(question) for question in response.json()]
+        self._questions = QUESTION_LIST_ADAPTER.validate_json(body)
+        return self._questions
 
-    def get_file(self, question: Question, file_path: Path) -> None:
+    async def get_file(self, question: Question, file_path: Path) -> None:
         """
         Get the file from the evaluation service.
+
+        The response is streamed to disk in chunks, so memory stays bounded
+        regardless of file size and the download overlaps the disk writes.
+        A previously downloaded file is revalidated with `If-None-Match`, so
+        an unchanged file costs a 304 instead of a re-download.
+
+        Downloads of the same path are serialized with a per-file lock, so
+        concurrent callers never write the same temporary file at once.
         """
         assert question.file_name, "Question does not have a file attached"
-        log.info(f"Downloading file {question.file_name} for task {question.task_id}")
 
-        url = str(self.base_url) + "files/" + question.task_id
-        response = httpx.get(url)
-        response.raise_for_status()
+        lock = self._file_locks.setdefault(file_path, asyncio.Lock())
+        existed = file_path.exists()
+        async with lock:
+            # Another caller may have finished the same download while we
+            # waited for the lock; the freshly written file needs no fetch
+            if not existed and file_path.exists() and file_path.stat().st_size > 0:
+                log.info(f"File {question.file_name} was downloaded concurrently")
+                return
+
+            log.info(
+                f"Downloading file {question.file_name} for task {question.task_id}"
+            )
+
+            etag_path = file_path.with_name(file_path.name + ".etag")
+            headers = {}
+            if file_path.exists() and etag_path.exists():
+                headers["If-None-Match"] = etag_path.read_text().strip()
+
+            async with self._client.stream(
+                "GET", "files/" + question.task_id, headers=headers
+            ) as response:
+                if response.status_code == httpx.codes.NOT_MODIFIED:
+                    log.info(f"File {question.file_name} unchanged, keeping local copy")
+                    return
+                response.raise_for_status()
+
+                # Stream to a temporary name and move it into place only once
+                # the download completed, so an aborted transfer never leaves a
+                # partial file at the final path mistaken for a complete one
+                part_path = file_path.with_name(file_path.name + ".part")
+                try:
+                    async with await anyio.open_file(part_path, "wb") as file_:
+                        async for chunk in response.aiter_bytes(1 << 16):
+                            await file_.write(chunk)
+                except BaseException:
+                    part_path.unlink(missing_ok=True)
+                    raise
+                os.replace(part_path, file_path)
 
-        # Save the file to the specified path
-        file_path.write_bytes(response.content)
+                if etag := response.headers.get("etag"):
+                    etag_path.write_text(etag)
 
-    def submit(
+    async def submit(
         self, username: str, agent_code: HttpUrl, results: list[Result]
     ) -> EvaluationResponse:
         """
         Submit the results to the evaluation service.
         """
         log.info("Submitting results to the evaluation service")
-        url = str(self.base_url) + "submit"
-        payload = {
-            "username": username,
-            "agent_code": str(agent_code),
-            "answers": [result.get_answer() for result in results],
-        }
-        response = httpx.post(url, json=payload)
+        payload = SubmitPayload(
+            username=username,
+            agent_code=str(agent_code),
+            answers=[result.get_answer() for result in results],
+        )
+        # Serialize once in pydantic-core instead of dicts + httpx's json.dumps
+        response = await self._client.post(
+            "submit",
+            content=payload.model_dump_json().encode("utf-8"),
+            headers={"content-type": "application/json"},
+        )
         response.raise_for_status()
 
         log.info("Results submitted successfully")
-        return EvaluationResponse.model_validate(response.json())
+        return EvaluationResponse.model_validate(orjson.loads(response.content))
@@ -1,3 +1,4 @@
+import functools
 from pathlib import Path
 from typing import Literal
 
@@ -20,6 +21,8 @@ class Settings(BaseSettings, env_file=".env"):
     gemini_api_key: SecretStr
     gemini_model: GEMINI_MODELS = "gemini-2.0-flash"
 
+    max_concurrency: int = 8
+
     huggingface_username: str = "hedderich"
     huggingface_space: HttpUrl = HttpUrl(
         "https://huggingface.co/spaces/hedderich/agents-course-gaia-challenge/tree/main"
@@ -27,6 +30,13 @@ class Settings(BaseSettings, env_file=".env"):
 
     @property
     def result_path(self) -> Path:
-        path = Path("results") / self.gemini_model
-        path.mkdir(parents=True, exist_ok=True)
-        return path
+        return Path("results") / self.gemini_model
+
+
+@functools.cache
+def get_settings() -> Settings:
+    """
+    Get the settings. Cached so `.env` is read and validated only once,
+    with every module sharing the same instance.
+    """
+    return Settings()  # type: ignore
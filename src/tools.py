@@ -1,11 +1,10 @@
+import functools
 import logging
 import re
 from io import StringIO
 from typing import Callable
 
 import httpx
-import pandas as pd  # type: ignore
-from bs4 import BeautifulSoup
 from google import genai
 from google.genai.types import (
     Content,
@@ -16,14 +15,33 @@ from google.genai.types import (
     Part,
 )
 from google.genai.types import Tool as GenaiTool
-from mediawikiapi import MediaWikiAPI  # type: ignore
 from pydantic import BaseModel
 
-from src.settings import Settings
+from src.settings import get_settings
 
-settings = Settings()  # type: ignore
+settings = get_settings()
 log = logging.getLogger(__name__)
 
+# Compiled once; collapses runs of three or more newlines
+_MULTI_NEWLINE = re.compile(r"\n{3,}")
+
+
+@functools.cache
+def _http_client() -> httpx.AsyncClient:
+    """
+    Shared async HTTP client so page fetches reuse one connection pool.
+    """
+    return httpx.AsyncClient(follow_redirects=True, timeout=30.0)
+
+
+@functools.cache
+def get_genai_client() -> genai.Client:
+    """
+    Shared Gemini client so all callers reuse one connection pool instead of
+    paying client construction and a TLS handshake per invocation.
+    """
+    return genai.Client(api_key=settings.gemini_api_key.get_secret_value())
+
 
 class Tool(BaseModel):
     function: Callable
@@ -31,6 +49,14 @@ class Tool(BaseModel):
     description: str
     function_declaration: FunctionDeclaration
 
+    @functools.cached_property
+    def genai_tool(self) -> GenaiTool:
+        """
+        The GenaiTool wrapper around the function declaration, built lazily
+        and reused so its schema is only validated once per tool.
+        """
+        return GenaiTool(function_declarations=[self.function_declaration])  # type: ignore
+
     @classmethod
     def from_function(cls, function: Callable) -> "Tool":
         """
@@ -68,6 +94,11 @@ async def wikipedia_search(wikipedia_title: str) -> str:
     str
         Wikipedia content of the top result.
     """
+    # Imported lazily so other commands and tools don't pay for them
+    import pandas as pd  # type: ignore
+    from bs4 import BeautifulSoup
+    from mediawikiapi import MediaWikiAPI  # type: ignore
+
     log.info(f"Searching Wikipedia for: {wikipedia_title}")
     wikipedia = MediaWikiAPI()
     titles = wikipedia.search(wikipedia_title, results=1)
@@ -76,10 +107,11 @@ async def wikipedia_search(wikipedia_title: str) -> str:
 
     # Get the first result
     page = wikipedia.page(titles[0])
-    response = httpx.get(page.url)
+    response = await _http_client().get(page.url)
     response.raise_for_status()
 
-    soup = BeautifulSoup(response.content, "html.parser")
+    # lxml parses at C level, roughly 2x faster than html.parser
+    soup = BeautifulSoup(response.content, "lxml")
 
     # Filter for bodyContent to avoid unnecessary processing
     body_content = soup.find(id="bodyContent")
@@ -87,23 +119,37 @@ async def wikipedia_search(wikipedia_title: str) -> str:
 
     # Process tables in the content
     tables = body_content.find_all("table")  # type: ignore
-    for table in tables:
+    dfs = []
+    if tables:
         try:
-            # Create a temporary HTML string with just this table
-            table_html = str(table)
-            # Use pandas to read the table and convert to markdown
-            dfs = pd.read_html(StringIO(table_html), flavor="bs4")
-            if dfs:
-                markdown_table = dfs[0].to_markdown()
-                # Create a new tag to replace the table
-                new_tag = soup.new_tag("div")
-                new_tag.string = f"\n\n{markdown_table}\n\n"
-                table.replace_with(new_tag)
+            # Parse all tables with a single pandas pass over the body
+            dfs = pd.read_html(StringIO(str(body_content)), flavor="lxml")
         except Exception as e:
-            log.warning(f"Failed to convert table to markdown: {str(e)}")
-
-    # Clean the text while preserving paragraph structure
-    cleaned_text = re.sub(r"\n{3,}", "\n\n", body_content.text)
+            log.warning(f"Failed to parse tables in one pass: {str(e)}")
+
+    if len(dfs) == len(tables):
+        for table, df in zip(tables, dfs):
+            # Create a new tag to replace the table
+            new_tag = soup.new_tag("div")
+            new_tag.string = f"\n\n{df.to_markdown()}\n\n"
+            table.replace_with(new_tag)
+    else:
+        # Fall back to converting each table individually when pandas found a
+        # different number of tables than the soup
+        for table in tables:
+            try:
+                table_dfs = pd.read_html(StringIO(str(table)), flavor="lxml")
+                if table_dfs:
+                    new_tag = soup.new_tag("div")
+                    new_tag.string = f"\n\n{table_dfs[0].to_markdown()}\n\n"
+                    table.replace_with(new_tag)
+            except Exception as e:
+                log.warning(f"Failed to convert table to markdown: {str(e)}")
+
+    # Clean the text while preserving paragraph structure. `.text` walks the
+    # whole DOM, so extract it once before substituting.
+    body_text = body_content.text
+    cleaned_text = _MULTI_NEWLINE.sub("\n\n", body_text)
 
     # Format the output using the template
     output_template = "Wikipedia: {title}\n```{content}```\n"
@@ -133,7 +179,7 @@ async def youtube_search(question: str, video_url: str) -> str | None:
     )
 
     log.info(f"Answering question: {question} based on video: {video_url}")
-    client = genai.Client(api_key=settings.gemini_api_key.get_secret_value())
+    client = get_genai_client()
     config = GenerateContentConfig(
         temperature=0.0,
     )
@@ -171,7 +217,7 @@ async def google_search(question: str) -> str | None:
         A concise answer based on the most relevant web results.
     """
     log.info(f"Searching Google for: {question}")
-    client = genai.Client(api_key=settings.gemini_api_key.get_secret_value())
+    client = get_genai_client()
     config = GenerateContentConfig(
         temperature=0.0,
         tools=[
@@ -206,7 +252,7 @@ async def decode_text(text: str) -> str:
         The decoded text.
     """
     log.info(f"Decoding text: {text}")
-    client = genai.Client(api_key=settings.gemini_api_key.get_secret_value())
+    client = get_genai_client()
     config = GenerateContentConfig(
         temperature=0.0,
     )
@@ -219,13 +265,15 @@ async def decode_text(text: str) -> str:
     return response.text
 
 
-def get_tools() -> list[Tool]:
+@functools.cache
+def get_tools() -> tuple[Tool, ...]:
     """
-    Get the list of tools.
+    Get the tools. Cached so the function declarations are only built once
+    per process, since deriving them from the callables is reflection-heavy.
     """
-    return [
+    return (
         Tool.from_function(wikipedia_search),
         Tool.from_function(youtube_search),
         Tool.from_function(google_search),
         Tool.from_function(decode_text),
-    ]
+    )
@@ -1,16 +1,23 @@
+import asyncio
+import hashlib
+import json
 import logging
+import re
+import sqlite3
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable
 
-import pandas as pd  # type: ignore
 from google import genai
 from google.genai.types import (
+    Candidate,
     Content,
+    File,
     FunctionCall,
     GenerateContentConfig,
+    GenerateContentResponse,
     Part,
 )
-from google.genai.types import Tool as GenaiTool
 from llama_index.core.workflow import (
     Context,
     Event,
@@ -20,7 +27,7 @@ from llama_index.core.workflow import (
     step,
 )
 from llama_index.core.workflow.retry_policy import ConstantDelayRetryPolicy
-from pydantic import SecretStr
+from pydantic import BaseModel, SecretStr
 
 from src.models import Result
 from src.services.evaluation_service import EvaluationService, Question
@@ -30,9 +37,15 @@ log = logging.getLogger(__name__)
 
 AGENT_INSTRUCTION = (
     "You are a general AI assistant. I will ask you a question. "
-    "Think step by step, explain your reasoning, and then give me the final answer. "
+    "Think step by step, explain your reasoning, and then finish your response "
+    "with a single line of the form `FINAL ANSWER: <your final answer>`. "
 )
 
+# Matches the trailing FINAL ANSWER line requested by AGENT_INSTRUCTION. The
+# capture stays on a single line, and the last match wins so commentary or an
+# earlier draft answer above the final line cannot leak into the result.
+_FINAL_ANSWER = re.compile(r"FINAL ANSWER:[ \t]*(.+)", re.M)
+
 GAIA_FORMAT_INSTRUCTION = (
     "YOUR FINAL ANSWER should be one of the following: a number, as few words as possible, or a comma separated list of numbers and/or strings. "
     "For numbers: Do not use commas as thousand separators. Do not include units such as $ or {%} unless specifically asked to do so. "
@@ -41,6 +54,40 @@ GAIA_FORMAT_INSTRUCTION = (
 )
 
 
+_GEMINI_CONFIG_CACHE: dict[tuple[str, ...], GenerateContentConfig] = {}
+
+
+def _build_gemini_config(tools: list[Tool]) -> GenerateContentConfig:
+    """
+    Build the tool-bearing generation config, cached per tool set since the
+    declarations are fixed for the life of the process.
+    """
+    key = tuple(tool.name for tool in tools)
+    if key not in _GEMINI_CONFIG_CACHE:
+        _GEMINI_CONFIG_CACHE[key] = GenerateContentConfig(
+            temperature=0.0,
+            tools=[tool.genai_tool for tool in tools],  # type: ignore
+            system_instruction="\n\n".join(
+                [AGENT_INSTRUCTION, GAIA_FORMAT_INSTRUCTION]
+            ),
+        )
+    return _GEMINI_CONFIG_CACHE[key]
+
+
+def _rows_to_markdown(rows: list[list[Any]]) -> str:
+    """
+    Render sheet rows as a markdown table by joining strings directly,
+    avoiding DataFrame construction and tabulate formatting.
+    """
+    if not rows:
+        return ""
+
+    header = "| " + " | ".join(map(str, rows[0])) + " |"
+    separator = "|" + "|".join(["---"] * len(rows[0])) + "|"
+    body = "\n".join("| " + " | ".join(map(str, row)) + " |" for row in rows[1:])
+    return "\n".join([header, separator, body])
+
+
 class QuestionStartEvent(StartEvent):
     question: Question
 
@@ -67,6 +114,8 @@ class ExtractAnswerEvent(Event):
 
 class QuestionWorkflow(Workflow):
     DEFAULT_RETRY = ConstantDelayRetryPolicy(delay=10, maximum_attempts=3)
+    RESPONSE_CACHE_TTL = 24 * 60 * 60  # seconds
+    MAX_INLINE_EXCEL_ROWS = 200
 
     def __init__(
         self,
@@ -76,30 +125,218 @@ class QuestionWorkflow(Workflow):
         gemini_api_key: SecretStr,
         evaluation_service: EvaluationService,
         data_path: Path = Path("data"),
+        prefetched_files: dict[str, asyncio.Task[Path]] | None = None,
+        gemini_client: genai.Client | None = None,
         **kwargs: Any,
     ) -> None:
         super().__init__(*args, **kwargs)
         self.model = model
         self.tools = tools
+        self._tool_by_name = {tool.name: tool for tool in tools}
         self.evaluation_service = evaluation_service
-        self.gemini_client = genai.Client(api_key=gemini_api_key.get_secret_value())
-        self.gemini_config = GenerateContentConfig(
+        self._prefetched_files = prefetched_files if prefetched_files is not None else {}
+        # Prefer a shared client so workflows reuse one connection pool
+        self.gemini_client = gemini_client or genai.Client(
+            api_key=gemini_api_key.get_secret_value()
+        )
+        self.gemini_config = _build_gemini_config(tools)
+
+        # Built once; extract_answer reuses it on every finalization call
+        self._extract_config = GenerateContentConfig(
             temperature=0.0,
-            tools=[
-                GenaiTool(
-                    function_declarations=[tool.function_declaration],
-                )  # type: ignore
-                for tool in tools
-            ],
-            system_instruction="\n\n".join(
-                [AGENT_INSTRUCTION, GAIA_FORMAT_INSTRUCTION]
-            ),
+            system_instruction="Your task is to extract the answer from the text. "
+            "Please respond ONLY with the answer, no other text.\n"
+            f"IMPORTANT FORMAT INSTRUCTIONS:\n{GAIA_FORMAT_INSTRUCTION}",
         )
 
         # Create the data path if it doesn't exist
         data_path.mkdir(parents=True, exist_ok=True)
         self.data_path = data_path
 
+        # Scheduled Gemini uploads keyed by file name; registered as soon as
+        # the upload task is created so workflows await it instead of
+        # uploading the same file themselves
+        self._preuploaded: dict[str, asyncio.Task[File]] = {}
+
+        # Memoized tool results, so identical (name, args) calls re-issued
+        # across reasoning steps don't re-execute the tool
+        self._tool_cache: dict[str, Any] = {}
+
+        # Persistent LLM response cache, so reruns of a question replay the
+        # earlier responses instead of paying network and token cost again
+        self._response_cache = sqlite3.connect(data_path / "llm_cache.sqlite3")
+        self._response_cache.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response BLOB, ts INT)"
+        )
+        self._response_cache.commit()
+
+    @staticmethod
+    async def _get_from_context[T](context: Context, key: str, type_: type[T]) -> T:
+        """
+        Get a value from the context, with the type check done once in one
+        place instead of a get/assert pair in every step.
+        """
+        value = await context.get(key)
+        assert isinstance(value, type_), f"`{key}` not found in context"
+        return value
+
+    @staticmethod
+    def _tool_cache_key(function_call: FunctionCall) -> str:
+        """
+        Build a stable cache key from the function call's name and arguments.
+        """
+        args = json.dumps(function_call.args or {}, sort_keys=True, default=str)
+        return hashlib.sha1(f"{function_call.name}:{args}".encode("utf-8")).hexdigest()
+
+    def _cache_key(
+        self,
+        contents: str | list[Any],
+        config: GenerateContentConfig,
+    ) -> str:
+        """
+        Build a stable cache key from the model, config, and contents.
+        """
+        parts = [self.model, config.model_dump_json(exclude_none=True)]
+        for item in contents if isinstance(contents, list) else [contents]:
+            if isinstance(item, BaseModel):
+                parts.append(item.model_dump_json(exclude_none=True))
+            else:
+                parts.append(str(item))
+        return hashlib.sha256("\x1e".join(parts).encode("utf-8")).hexdigest()
+
+    def _response_cache_get(self, key: str) -> GenerateContentResponse | None:
+        """
+        Look up a persisted language model response that has not expired.
+        """
+        row = self._response_cache.execute(
+            "SELECT response FROM responses WHERE key = ? AND ts > ?",
+            (key, int(time.time()) - self.RESPONSE_CACHE_TTL),
+        ).fetchone()
+        if row is None:
+            return None
+
+        log.info("Replaying cached language model response")
+        return GenerateContentResponse.model_validate_json(row[0])
+
+    def _response_cache_put(self, key: str, response: GenerateContentResponse) -> None:
+        """
+        Persist a language model response under the given key.
+        """
+        self._response_cache.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+            (key, response.model_dump_json(), int(time.time())),
+        )
+        self._response_cache.commit()
+
+    async def _cached_generate_content(
+        self,
+        contents: str | list[Any],
+        config: GenerateContentConfig,
+    ) -> GenerateContentResponse:
+        """
+        Call the language model, replaying the persisted response when the
+        same (model, config, contents) tuple was answered before.
+        """
+        key = self._cache_key(contents, config)
+        if cached := self._response_cache_get(key):
+            return cached
+
+        response = await self.gemini_client.aio.models.generate_content(
+            model=self.model,
+            contents=contents,  # type: ignore
+            config=config,
+        )
+        self._response_cache_put(key, response)
+        return response
+
+    async def _execute_function_call(self, function_call: FunctionCall) -> Any:
+        """
+        Execute a function call through the tool cache.
+        """
+        assert function_call.name, "Function call has no name"
+        tool = self._tool_by_name.get(function_call.name)
+        assert tool, f"Tool {function_call.name} not found"
+
+        key = self._tool_cache_key(function_call)
+        if key in self._tool_cache:
+            log.info(f"Reusing cached result for function: {function_call.name}")
+            return self._tool_cache[key]
+
+        response = await tool.function(
+            **function_call.args if function_call.args else {}
+        )
+        self._tool_cache[key] = response
+        return response
+
+    async def run_batch(
+        self,
+        questions: list[Question],
+        *,
+        max_concurrency: int = 8,
+        on_result: Callable[[Result], Awaitable[None]] | None = None,
+    ) -> list[Result | BaseException]:
+        """
+        Run the workflow over the questions with bounded concurrency, so the
+        network and LLM latency of one question is masked by the others.
+        Failures are returned in place of their results instead of cancelling
+        the remaining questions. `on_result` is awaited per finished question,
+        e.g. to persist the result as soon as it is available.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(question: Question) -> Result:
+            async with semaphore:
+                log.info(f"Processing Task: {question.task_id}")
+                result: Result = await self.run(
+                    start_event=QuestionStartEvent(question=question)
+                )
+                if on_result is not None:
+                    await on_result(result)
+                return result
+
+        return await asyncio.gather(
+            *[run_one(question) for question in questions], return_exceptions=True
+        )
+
+    async def preupload_files(self, questions: list[Question]) -> None:
+        """
+        Upload the attachments of the given questions to Gemini ahead of time,
+        so upload_file finds them ready instead of uploading one at a time on
+        each question's critical path. Excel files are skipped since they are
+        inlined as markdown rather than uploaded.
+        """
+        semaphore = asyncio.Semaphore(6)
+
+        async def upload(question: Question) -> File:
+            file_path = self.data_path / question.file_name
+            async with semaphore:
+                # Make sure the file is on disk before uploading
+                if prefetch_task := self._prefetched_files.get(question.task_id):
+                    await prefetch_task
+                elif not (file_path.exists() and file_path.stat().st_size > 0):
+                    await self.evaluation_service.get_file(question, file_path)
+
+                log.info(f"Pre-uploading file {file_path} to Gemini")
+                return await self.gemini_client.aio.files.upload(file=file_path)
+
+        # Register the tasks up front, so a workflow reaching upload_file
+        # before its upload finished awaits it instead of uploading again
+        upload_tasks: list[asyncio.Task[File]] = []
+        for question in questions:
+            if not question.file_name:
+                continue
+            if (self.data_path / question.file_name).suffix in [".xls", ".xlsx"]:
+                continue
+
+            upload_task = asyncio.create_task(upload(question))
+            self._preuploaded[question.file_name] = upload_task
+            upload_tasks.append(upload_task)
+
+        outcomes = await asyncio.gather(*upload_tasks, return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                log.warning(f"Pre-upload failed: {outcome}")
+
     @step(retry_policy=DEFAULT_RETRY)
     async def start(
         self,
@@ -132,12 +369,22 @@ class QuestionWorkflow(Workflow):
         """
         Download the file from the evaluation service.
         """
-        question = await context.get("question")
-        assert isinstance(question, Question), "`question` not found in context"
+        question = await self._get_from_context(context, "question", Question)
 
-        # Download the file
+        # Wait for the prefetched download if one was scheduled for this task.
+        # This has to happen before the on-disk check, since a prefetch still
+        # in flight may have written the file only partially.
+        if prefetch_task := self._prefetched_files.pop(question.task_id, None):
+            return UploadFileEvent(file_path=await prefetch_task)
+
+        # Reuse the file from a previous run if it is already on disk
         file_path = self.data_path / question.file_name
-        self.evaluation_service.get_file(question, file_path)
+        if file_path.exists() and file_path.stat().st_size > 0:
+            log.info(f"File {file_path} already downloaded. Skipping download.")
+            return UploadFileEvent(file_path=file_path)
+
+        # Download the file
+        await self.evaluation_service.get_file(question, file_path)
 
         return UploadFileEvent(file_path=file_path)
 
@@ -150,29 +397,50 @@ class QuestionWorkflow(Workflow):
         """
         Upload the file to the language model.
         """
-        contents = await context.get("contents")
-        assert isinstance(contents, list), "`question` not found in context"
+        contents = await self._get_from_context(context, "contents", list)
 
         # Handle Excel files differently due to compatibility issues with gemini
         if event.file_path.suffix in [".xls", ".xlsx"]:
+            # Imported lazily, only Excel-bearing questions need it
+            from python_calamine import CalamineWorkbook  # type: ignore
+
             log.info(f"Reading Excel file {event.file_path}")
-            df = pd.read_excel(event.file_path)
+            # Parse in a worker thread so the loop keeps serving other workflows
+            workbook = await asyncio.to_thread(
+                CalamineWorkbook.from_path, str(event.file_path)
+            )
+            rows = workbook.get_sheet_by_index(0).to_python()
+
+            # Cap the inline preview for large sheets, so they neither blow
+            # the context window nor burn seconds of formatting
+            data_rows = max(len(rows) - 1, 0)
+            if data_rows > self.MAX_INLINE_EXCEL_ROWS:
+                preview = _rows_to_markdown(rows[:101] + rows[-50:])
+                text = (
+                    f'<excel-content rows="{data_rows}" '
+                    f'preview="first 100 and last 50 rows">{preview}</excel-content>'
+                )
+            else:
+                text = f"<excel-content>{_rows_to_markdown(rows)}</excel-content>"
+
             contents.append(
                 Content(
                     role="user",
                     parts=[
-                        Part(text=f"<excel-content>{df.to_markdown()}</excel-content>"),
+                        Part(text=text),
                     ],
                 )
             )
         else:
-            # Upload the file to gemini
-            log.info(f"Uploading file {event.file_path} to Gemini")
-            file_ = await self.gemini_client.aio.files.upload(file=event.file_path)
+            # Await the scheduled pre-upload when one exists, upload otherwise
+            if upload_task := self._preuploaded.pop(event.file_path.name, None):
+                file_ = await upload_task
+            else:
+                log.info(f"Uploading file {event.file_path} to Gemini")
+                file_ = await self.gemini_client.aio.files.upload(file=event.file_path)
 
             # Add the file to the contents
             contents.append(file_)
-        await context.set("contents", contents)
 
         return LanguageModelEvent()
 
@@ -185,20 +453,57 @@ class QuestionWorkflow(Workflow):
         """
         Call the language model with the question and file.
         """
-        question = await context.get("question")
-        contents = await context.get("contents")
-        assert isinstance(question, Question), "`question` not found in context"
-        assert isinstance(contents, list), "`contents` not found in context"
-
-        # Call the language model
-        response = await self.gemini_client.aio.models.generate_content(
-            model=self.model,
-            contents=contents,  # type: ignore
-            config=self.gemini_config,
-        )
+        question = await self._get_from_context(context, "question", Question)
+        contents = await self._get_from_context(context, "contents", list)
+
+        # Call the language model. On a cache miss the response is streamed,
+        # so tool calls start the moment their declaration arrives instead of
+        # waiting for the last token.
+        tool_tasks: list[asyncio.Task[Any]] = []
+        cache_key = self._cache_key(contents, self.gemini_config)
+        if (response := self._response_cache_get(cache_key)) is None:
+            parts: list[Part] = []
+            stream = await self.gemini_client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=contents,  # type: ignore
+                config=self.gemini_config,
+            )
+            try:
+                async for chunk in stream:
+                    for candidate in chunk.candidates or []:
+                        if candidate.content is None:
+                            continue
+                        for part in candidate.content.parts or []:
+                            parts.append(part)
+                            if part.function_call:
+                                tool_tasks.append(
+                                    asyncio.create_task(
+                                        self._execute_function_call(part.function_call)
+                                    )
+                                )
+            except BaseException:
+                # Don't leave already started tool tasks orphaned when the
+                # stream fails and the step retries
+                for task in tool_tasks:
+                    task.cancel()
+                await asyncio.gather(*tool_tasks, return_exceptions=True)
+                raise
+
+            # Reassemble the streamed parts into one response for the cache
+            response = GenerateContentResponse(
+                candidates=[Candidate(content=Content(role="model", parts=parts))]
+            )
+            self._response_cache_put(cache_key, response)
 
         # Check if the response contains function calls
         if response.function_calls:
+            # On a cache hit the tool tasks haven't been started yet
+            if not tool_tasks:
+                tool_tasks = [
+                    asyncio.create_task(self._execute_function_call(function_call))
+                    for function_call in response.function_calls
+                ]
+            await context.set("pending_tool_tasks", tool_tasks)
             return FunctionCallEvent(function_calls=response.function_calls)
 
         # If the response contains no function calls, append the final message and extract the answer
@@ -209,10 +514,6 @@ class QuestionWorkflow(Workflow):
                 parts=[Part(text=response.text)],
             )
         )
-        await context.set("contents", contents)
-
-        # If no function calls, extract the answer directly
-        assert response.text, "Response text is empty"
         return ExtractAnswerEvent(text=response.text)
 
     @step(retry_policy=DEFAULT_RETRY)
@@ -224,10 +525,11 @@ class QuestionWorkflow(Workflow):
         """
         Call the function with the function calls from the language model.
         """
-        contents = await context.get("contents")
-        assert isinstance(contents, list), "`contents` not found in context"
+        contents = await self._get_from_context(context, "contents", list)
+        tool_tasks = await self._get_from_context(context, "pending_tool_tasks", list)
 
-        # Execute all function calls
+        # Record the function calls and resolve their tools up front
+        tools: list[Tool] = []
         for function_call in event.function_calls:
             log.info(f"Calling function: {function_call.name}")
             # Add the function call to the contents
@@ -235,22 +537,36 @@ class QuestionWorkflow(Workflow):
                 Content(role="model", parts=[Part(function_call=function_call)])
             )
 
-            # Execute the function
-            tool: Tool | None = next(
-                filter(lambda tool: tool.name == function_call.name, self.tools)
-            )
+            assert function_call.name, "Function call has no name"
+            tool: Tool | None = self._tool_by_name.get(function_call.name)
             assert tool, f"Tool {function_call.name} not found"
-            response = await tool.function(
-                **function_call.args if function_call.args else {}
-            )
+            tools.append(tool)
+
+        # The tasks were started while the response streamed in; awaiting an
+        # already finished task just returns its result, so retries are safe
+        if len(tool_tasks) != len(event.function_calls):
+            tool_tasks = [
+                asyncio.create_task(self._execute_function_call(function_call))
+                for function_call in event.function_calls
+            ]
+
+        responses = await asyncio.gather(*tool_tasks, return_exceptions=True)
+
+        # Add the results to the contents in call order. A failed call is
+        # reported back to the model instead of aborting its sibling calls.
+        for tool, response in zip(tools, responses):
+            if isinstance(response, BaseException):
+                log.warning(f"Function {tool.name} failed: {response}")
+                function_response: dict[str, Any] = {"error": str(response)}
+            else:
+                function_response = {"result": response}
 
-            # Add the result to the contents
             contents.append(
                 Content(
                     role="user",
                     parts=[
                         Part.from_function_response(
-                            name=tool.name, response={"result": response}
+                            name=tool.name, response=function_response
                         )
                     ],
                 )
@@ -268,18 +584,19 @@ class QuestionWorkflow(Workflow):
         """
         Extract the answer from the language model response.
         """
-        question = await context.get("question")
-        assert isinstance(question, Question), "`question` not found in context"
+        question = await self._get_from_context(context, "question", Question)
 
-        response = await self.gemini_client.aio.models.generate_content(
-            model=self.model,
-            contents=f"QUESTION: {question.question}\n\nSOLUTION TEXT: {event.text}",
-            config=GenerateContentConfig(
-                temperature=0.0,
-                system_instruction="Your task is to extract the answer from the text. "
-                "Please respond ONLY with the answer, no other text.\n"
-                f"IMPORTANT FORMAT INSTRUCTIONS:\n{GAIA_FORMAT_INSTRUCTION}",
-            ),
+        # The system prompt asks for a trailing FINAL ANSWER line; extracting
+        # it locally saves a second LLM round trip per question
+        if matches := _FINAL_ANSWER.findall(event.text):
+            return StopEvent(
+                result=Result(question=question, answer=matches[-1].strip())
+            )
+
+        # Fall back to the language model if the template was not followed
+        response = await self._cached_generate_content(
+            f"QUESTION: {question.question}\n\nSOLUTION TEXT: {event.text}",
+            self._extract_config,
         )
         assert response.text, "Response text is empty"
         return StopEvent(result=Result(question=question, answer=response.text.strip()))